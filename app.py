@@ -2,12 +2,25 @@ import streamlit as st
 import pandas as pd
 import time
 import io
+import hashlib
+import concurrent.futures
+from collections import deque
+
+# Optional Rust-backed Excel writer (much faster than pandas/openpyxl on large results)
+try:
+    from rustpy_xlsxwriter import FastExcel
+except ImportError:
+    FastExcel = None
 
 from app_core import (
     generate_sql_from_text,
+    generate_sql_and_explanation,
+    clean_generated_sql,
+    check_sql,
     is_sql_safe,
-    explain_sql,
+    explain_sql_async,
     run_sql,
+    get_db_schema,
 )
 
 # ---------------------------------------------------
@@ -21,15 +34,75 @@ st.set_page_config(
 # ---------------------------------------------------
 # SESSION STATE
 # ---------------------------------------------------
+# Most recent first, capped so long sessions don't grow without bound
+HISTORY_LIMIT = 50
+
 if "history" not in st.session_state:
-    st.session_state.history = []
+    st.session_state.history = deque(maxlen=HISTORY_LIMIT)
 
+# CleanedSQL (text + lowercased text + safety verdict) of the last generated query
 if "generated_sql" not in st.session_state:
-    st.session_state.generated_sql = ""
+    st.session_state.generated_sql = None
+
+# Explanation that came back with generated_sql (single-call path), else ""
+if "generated_explanation" not in st.session_state:
+    st.session_state.generated_explanation = ""
 
+# Last executed query: {"sql", "df", "time", "explanation"} or None
 if "query_result" not in st.session_state:
     st.session_state.query_result = None
 
+if "run_pending" not in st.session_state:
+    st.session_state.run_pending = False
+
+# Results larger than this are shown one page at a time (full df is kept for export)
+MAX_RENDERED_ROWS = 500
+
+# ---------------------------------------------------
+# RESULT HELPERS (cached per result so reruns don't recompute)
+# ---------------------------------------------------
+def df_cache_key(df: pd.DataFrame) -> tuple:
+    """Cheap content key for a result DataFrame (ordered row hashes + column names + dtypes)."""
+    row_hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    digest = hashlib.blake2b(row_hashes.tobytes(), digest_size=16).hexdigest()
+    return digest, tuple(df.columns), tuple(str(dtype) for dtype in df.dtypes)
+
+
+@st.cache_resource
+def load_db_schema() -> dict:
+    """DB schema read once per server process (treat the returned dict as read-only)."""
+    return get_db_schema()
+
+
+@st.cache_data(max_entries=20)
+def build_chart_data(df_hash: tuple, _df: pd.DataFrame):
+    """First text column vs. sum of first numeric column, or None if the result can't be charted."""
+    numeric_cols = _df.select_dtypes(include="number").columns
+    object_cols = _df.select_dtypes(include="object").columns
+    if len(_df) < 2 or not len(numeric_cols) or not len(object_cols):
+        return None
+    return _df.groupby(object_cols[0], observed=True, sort=False)[numeric_cols[0]].sum()
+
+
+@st.cache_data(max_entries=20)
+def build_csv_bytes(df_hash: tuple, _df: pd.DataFrame) -> bytes:
+    """CSV bytes for the result; cached on df_hash (the frame itself is not hashed)."""
+    csv_buffer = io.BytesIO()
+    # Write straight into a bytes buffer (no intermediate str + encode copy)
+    _df.to_csv(csv_buffer, index=False, encoding="utf-8")
+    return csv_buffer.getvalue()
+
+
+@st.cache_data(max_entries=20)
+def build_excel_bytes(df_hash: tuple, _df: pd.DataFrame) -> bytes:
+    """Excel bytes for the result; cached on df_hash (the frame itself is not hashed)."""
+    excel_buffer = io.BytesIO()
+    if FastExcel is not None:
+        FastExcel(excel_buffer).sheet("Sheet1", _df).save()
+    else:
+        _df.to_excel(excel_buffer, index=False)
+    return excel_buffer.getvalue()
+
 # ---------------------------------------------------
 # TITLE
 # ---------------------------------------------------
@@ -78,25 +151,16 @@ with st.expander("💡 Try example questions"):
 # DATABASE SCHEMA
 # ---------------------------------------------------
 with st.expander("📦 View Database Schema"):
-    st.markdown("""
-**sales**
-- id
-- date
-- product_id
-- customer_id
-- quantity
-- price
-
-**products**
-- product_id
-- product_name
-- category
-
-**customers**
-- customer_id
-- name
-- city
-""")
+    schema = load_db_schema()
+    if not schema:
+        # Don't keep the empty result cached; re-check on the next rerun
+        load_db_schema.clear()
+        st.warning("Database not found. Run generate_demo_db.py first.")
+    else:
+        st.markdown("\n\n".join(
+            f"**{table}**\n" + "\n".join(f"- {col}" for col in cols)
+            for table, cols in schema.items()
+        ))
 
 # ---------------------------------------------------
 # INPUT
@@ -111,7 +175,7 @@ with col1:
     generate_btn = st.button("Generate & Run SQL")
 with col2:
     if st.button("Clear History"):
-        st.session_state.history = []
+        st.session_state.history.clear()
         st.success("History cleared")
 
 # ---------------------------------------------------
@@ -122,60 +186,134 @@ if generate_btn:
         st.warning("Please enter a question")
         st.stop()
 
-    with st.spinner("Generating SQL..."):
-        sql = generate_sql_from_text(question)
+    if learning_mode:
+        # Read-only SQL is always run as generated, so get SQL + explanation in one call
+        with st.spinner("Generating SQL..."):
+            try:
+                generated, explanation = generate_sql_and_explanation(question)
+            except Exception as e:
+                st.error(f"SQL generation failed: {e}")
+                st.stop()
+    else:
+        # Stream tokens so the SQL starts appearing immediately, then show the cleaned version below
+        stream_box = st.empty()
+        raw_sql = ""
+        try:
+            # Each item is the text so far (it starts over if a cut-off reply is retried)
+            for raw_sql in generate_sql_from_text(question, stream=True):
+                stream_box.code(raw_sql, language="sql")
+        except Exception as e:
+            stream_box.empty()
+            st.error(f"SQL generation failed: {e}")
+            st.stop()
+        stream_box.empty()
+        # Editable SQL: the explanation is requested for whatever actually runs
+        generated, explanation = clean_generated_sql(raw_sql), ""
 
-    st.session_state.generated_sql = sql
+    st.session_state.generated_sql = generated
+    st.session_state.generated_explanation = explanation
+    # Results of the previous query no longer match the SQL on screen
+    st.session_state.query_result = None
+    # Beginner Mode runs a freshly generated query once, automatically
+    st.session_state.run_pending = True
 
 # ---------------------------------------------------
 # SQL DISPLAY (READ-ONLY / EDITABLE)
 # ---------------------------------------------------
-if st.session_state.generated_sql:
+generated = st.session_state.generated_sql
+
+if generated is not None and generated.raw:
 
     st.subheader("Generated SQL")
 
     if learning_mode:
-        st.code(st.session_state.generated_sql, language="sql")
-        run_sql_text = st.session_state.generated_sql
-        run_now = True
+        st.code(generated.raw, language="sql")
+        checked_sql = generated
+        run_now = st.session_state.run_pending
     else:
         edited_sql = st.text_area(
             "Edit SQL and click Run SQL",
-            value=st.session_state.generated_sql,
+            value=generated.raw,
             height=120
         )
         run_now = st.button("▶ Run SQL")
-        run_sql_text = edited_sql
+        # Only an edited query needs a fresh lowercase + safety pass
+        checked_sql = generated if edited_sql == generated.raw else check_sql(edited_sql)
 
     # ---------------------------------------------------
-    # RUN SQL
+    # RUN SQL (only on a real run; widget reruns reuse the stored result)
     # ---------------------------------------------------
     if run_now:
+        st.session_state.run_pending = False
 
-        if not is_sql_safe(run_sql_text):
+        if not is_sql_safe(checked_sql):
             st.error("Unsafe SQL detected. Only SELECT queries are allowed.")
+            # Don't leave the previous query's results on screen on the next rerun
+            st.session_state.query_result = None
             st.stop()
 
+        if checked_sql is generated and st.session_state.generated_explanation:
+            # Already explained by the single-call path
+            explanation_future = concurrent.futures.Future()
+            explanation_future.set_result(st.session_state.generated_explanation)
+        else:
+            # Explanation only needs the SQL, so request it now and let it run
+            # while the query executes and the results render
+            explanation_future = explain_sql_async(checked_sql.raw)
+
         start_time = time.time()
         try:
-            df = run_sql(run_sql_text)
+            df = run_sql(checked_sql)
         except Exception as e:
             st.error(f"SQL Error: {e}")
+            # Failed query: drop its explanation (not shown, so not worth caching)
+            explanation_future.cancel()
+            st.session_state.query_result = None
             st.stop()
 
         exec_time = round(time.time() - start_time, 4)
 
-        st.success("✅ Query executed successfully")
-        st.info(f"📊 Rows returned: {len(df)} | ⏱ Time: {exec_time}s")
+        st.session_state.query_result = {
+            "sql": checked_sql.raw,
+            "df": df,
+            "time": exec_time,
+            # Future; .result() is instant once the explanation has arrived
+            "explanation": explanation_future,
+        }
+        # New result starts on the first page
+        st.session_state.pop("result_page", None)
 
-        st.session_state.query_result = df
+        # ---------------------------------------------------
+        # SAVE HISTORY
+        # ---------------------------------------------------
+        st.session_state.history.appendleft({
+            "question": question,
+            "sql": checked_sql.raw,
+            "rows": len(df),
+            "time": exec_time
+        })
+
+    # ---------------------------------------------------
+    # RESULT DISPLAY (from session state, so paging/downloads survive reruns)
+    # ---------------------------------------------------
+    result = st.session_state.query_result
+
+    # Only show results for the SQL currently on screen (an edit hides them until Run)
+    if result is not None and result["sql"] != checked_sql.raw:
+        st.info("SQL changed. Click ▶ Run SQL to see its results.")
+    elif result is not None:
+        df = result["df"]
+
+        st.success("✅ Query executed successfully")
+        st.info(f"📊 Rows returned: {len(df)} | ⏱ Time: {result['time']}s")
 
         # ---------------------------------------------------
         # EXPLANATION
         # ---------------------------------------------------
         st.subheader("Explanation (Plain English)")
-        explanation = explain_sql(run_sql_text)
-        st.info(explanation)
+        # Placeholder keeps the explanation above the results; filled in once ready
+        explanation_box = st.empty()
+        explanation_box.caption("Generating explanation...")
 
         # ---------------------------------------------------
         # RESULTS
@@ -184,17 +322,45 @@ if st.session_state.generated_sql:
             st.warning("Query returned 0 rows")
         else:
             st.subheader("Query Results")
-            st.dataframe(df)
+
+            if len(df) > MAX_RENDERED_ROWS:
+                page_col, size_col = st.columns(2)
+                with size_col:
+                    page_size = st.select_slider(
+                        "Page size",
+                        options=[100, 250, 500, 1000],
+                        value=MAX_RENDERED_ROWS,
+                        key="result_page_size"
+                    )
+                total_pages = (len(df) - 1) // page_size + 1
+                # Changing the page size can leave the stored page past the end
+                if st.session_state.get("result_page", 1) > total_pages:
+                    st.session_state.result_page = total_pages
+                with page_col:
+                    page = st.number_input(
+                        "Page",
+                        min_value=1,
+                        max_value=total_pages,
+                        step=1,
+                        key="result_page"
+                    )
+
+                start = (page - 1) * page_size
+                end = min(start + page_size, len(df))
+                st.dataframe(df.iloc[start:end])
+                st.caption(f"Showing rows {start + 1}-{end} of {len(df)}")
+            else:
+                st.dataframe(df)
+
+            df_hash = df_cache_key(df)
 
             # ---------------------------------------------------
             # AUTO CHART
             # ---------------------------------------------------
-            numeric_cols = df.select_dtypes(include="number").columns
-            object_cols = df.select_dtypes(include="object").columns
+            chart_df = build_chart_data(df_hash, df)
 
-            if len(numeric_cols) and len(object_cols):
+            if chart_df is not None:
                 st.subheader("Auto Chart")
-                chart_df = df.groupby(object_cols[0])[numeric_cols[0]].sum()
                 st.bar_chart(chart_df)
 
             # ---------------------------------------------------
@@ -202,32 +368,21 @@ if st.session_state.generated_sql:
             # ---------------------------------------------------
             st.subheader("⬇ Export Results")
 
-            csv = df.to_csv(index=False).encode("utf-8")
             st.download_button(
                 "Download CSV",
-                csv,
+                build_csv_bytes(df_hash, df),
                 file_name="result.csv",
                 mime="text/csv"
             )
 
-            excel_buffer = io.BytesIO()
-            df.to_excel(excel_buffer, index=False)
             st.download_button(
                 "Download Excel",
-                excel_buffer.getvalue(),
+                build_excel_bytes(df_hash, df),
                 file_name="result.xlsx",
                 mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
             )
 
-        # ---------------------------------------------------
-        # SAVE HISTORY
-        # ---------------------------------------------------
-        st.session_state.history.insert(0, {
-            "question": question,
-            "sql": run_sql_text,
-            "rows": len(df),
-            "time": exec_time
-        })
+        explanation_box.info(result["explanation"].result())
 
 # ---------------------------------------------------
 # SIDEBAR HISTORY
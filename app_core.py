@@ -2,30 +2,89 @@
 """
 App core for Text -> SQL application (OpenAI v2.x compatible)
 - Generates SQL from natural language using OpenAI
-- Explains SQL using OpenAI
+- Explains SQL using OpenAI (or generates SQL + explanation in a single call)
 - Runs SQL safely on local SQLite DB (sales.db)
 - Contains small auto-join fixer and schema-aware prompt
+- Returns generated SQL as CleanedSQL (text + lowercased text + safety verdict, computed once)
+- Caches LLM responses in memory and in an llm_cache table inside sales.db
 """
 
 import os
 import sqlite3
+import threading
+import concurrent.futures
+from dataclasses import dataclass
+import json
+import hashlib
+import functools
 import pandas as pd
 import re
 from openai import OpenAI
 from dotenv import load_dotenv
 
-# Load .env
-load_dotenv()
+# Optional: ADBC SQLite driver returns results as Arrow tables (no per-cell Python objects)
+try:
+    import adbc_driver_sqlite.dbapi as adbc_sqlite
+except ImportError:
+    adbc_sqlite = None
 
-API_KEY = os.getenv("OPENAI_API_KEY")
-if not API_KEY:
-    raise Exception("OPENAI_API_KEY not found in environment. Please set it in .env file.")
-
-# Initialize OpenAI client
-client = OpenAI(api_key=API_KEY)
+# ---- OpenAI client (created on first LLM call, so DB-only use needs no API key) ----
+@functools.lru_cache(maxsize=1)
+def _client() -> OpenAI:
+    """
+    Load .env and build the OpenAI client once.
+    """
+    load_dotenv()
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise Exception("OPENAI_API_KEY not found in environment. Please set it in .env file.")
+    return OpenAI(api_key=api_key)
 
 DB_PATH = "sales.db"
 
+# Table (inside DB_PATH) where LLM responses are persisted across restarts
+LLM_CACHE_TABLE = "llm_cache"
+# Bump when post-processing of model output changes (cleaning, join fixing, parsing);
+# prompt edits need no bump because the full prompt is part of the cache key
+LLM_CACHE_VERSION = 1
+
+# ---- Shared SQLite connection ----
+# One connection for the whole process (opened on first use); Streamlit sessions
+# run in threads, so every use must hold _CONN_LOCK.
+_CONN = None
+_CONN_LOCK = threading.Lock()
+
+def _get_conn() -> sqlite3.Connection:
+    """
+    Return the shared connection to DB_PATH, opening it and applying performance PRAGMAs once.
+    Caller must hold _CONN_LOCK.
+    """
+    global _CONN
+    if _CONN is None:
+        conn = sqlite3.connect(DB_PATH, check_same_thread=False, isolation_level=None)
+        conn.executescript(
+            "PRAGMA journal_mode=WAL;"
+            "PRAGMA synchronous=NORMAL;"
+            "PRAGMA temp_store=MEMORY;"
+            "PRAGMA cache_size=-65536;"
+            "PRAGMA mmap_size=268435456;"
+            f"CREATE TABLE IF NOT EXISTS {LLM_CACHE_TABLE} (key TEXT PRIMARY KEY, value TEXT);"
+        )
+        _CONN = conn
+    return _CONN
+
+_ADBC_CONN = None
+
+def _get_adbc_conn():
+    """
+    Return the shared read-only ADBC connection to DB_PATH (only when adbc_sqlite is installed).
+    Opened once, in autocommit mode so each query sees the latest data. Caller must hold _CONN_LOCK.
+    """
+    global _ADBC_CONN
+    if _ADBC_CONN is None:
+        _ADBC_CONN = adbc_sqlite.connect(f"file:{DB_PATH}?mode=ro", autocommit=True)
+    return _ADBC_CONN
+
 # ---- Database schema reference (explicit) ----
 # We give this to the LLM so it doesn't invent wrong column names like products.name or products.id
 SCHEMA_NOTE = """
@@ -51,6 +110,11 @@ TABLE sales:
 """
 
 # ---- Helpers ----
+# Patterns used on every generated query, compiled once
+_FENCE_RE = re.compile(r"```(?:sql)?", re.IGNORECASE)
+_SELECT_RE = re.compile(r"(select\b.*)", re.IGNORECASE | re.DOTALL)
+_FROM_SALES_RE = re.compile(r"from\s+sales\b", re.IGNORECASE)
+
 def _clean_model_sql(raw: str) -> str:
     """
     Remove markdown fences and extraneous commentary from model output.
@@ -59,10 +123,10 @@ def _clean_model_sql(raw: str) -> str:
         return raw
     sql = raw.strip()
     # Remove triple backticks (```sql or ``` or ```text)
-    sql = re.sub(r"```(?:sql)?", "", sql, flags=re.IGNORECASE).strip()
+    sql = _FENCE_RE.sub("", sql).strip()
     # If model returned explanation followed by SQL, try to extract the longest SQL-looking substring
     # A naive approach: find first "SELECT" and take until the last semicolon (if exists) or end.
-    m = re.search(r"(?i)(select\b.*)", sql, flags=re.DOTALL)
+    m = _SELECT_RE.search(sql)
     if m:
         candidate = m.group(1).strip()
         # If there are multiple statements, keep everything up to last semicolon (or entire string).
@@ -70,65 +134,146 @@ def _clean_model_sql(raw: str) -> str:
         return candidate
     return sql
 
-def _auto_fix_joins(sql: str) -> str:
+def _auto_fix_joins(sql: str, sql_lower: str = None) -> str:
     """
     If the LLM produced a query referencing sales but didn't include JOINs for product_name/customer name,
     add appropriate LEFT JOINs. This is a heuristic only.
+    Pass `sql_lower` if the caller already has the lowercased SQL.
     """
-    sql_lower = sql.lower()
+    if sql_lower is None:
+        sql_lower = sql.lower()
     if "from sales" in sql_lower and ("product_name" in sql_lower or "customer_name" in sql_lower or "customers.name" in sql_lower):
         # If joins already present, return as is
         if "join products" in sql_lower or "join customers" in sql_lower:
             return sql
         # Add LEFT JOINs to map product_id -> product_name and customer_id -> name
         # We attempt to inject joins after the FROM clause. This is a simple safe approach.
-        pattern = re.compile(r'from\s+sales\b', flags=re.IGNORECASE)
         replacement = (
             "FROM sales s\nLEFT JOIN products p ON s.product_id = p.product_id\nLEFT JOIN customers c ON s.customer_id = c.customer_id"
         )
-        fixed_sql = pattern.sub(replacement, sql, count=1)
+        fixed_sql = _FROM_SALES_RE.sub(replacement, sql, count=1)
         return fixed_sql
     return sql
 
+# ---- LLM response cache ----
+def _normalize_prompt(text: str) -> str:
+    """
+    Collapse whitespace so trivially different prompts share a cache entry.
+    Case is kept on purpose: values like city names are copied into SQL literals.
+    """
+    return " ".join((text or "").split())
+
+def _cache_key(kind: str, model: str, messages: list) -> str:
+    """
+    Stable key for the persistent cache: blake2b hash of kind + model + cache version
+    + the exact chat messages sent, so editing a prompt never serves stale answers.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"{kind}\0{model}\0{LLM_CACHE_VERSION}\0".encode("utf-8"))
+    h.update(json.dumps(messages, sort_keys=True).encode("utf-8"))
+    return h.hexdigest()
+
+def _cache_get(key: str):
+    """
+    Look up a cached LLM response in DB_PATH. Returns None on miss or if the cache is unavailable.
+    """
+    if not os.path.exists(DB_PATH):
+        return None
+    try:
+        with _CONN_LOCK:
+            row = _get_conn().execute(f"SELECT value FROM {LLM_CACHE_TABLE} WHERE key = ?", (key,)).fetchone()
+    except sqlite3.Error:
+        # Cache is best-effort; never let it break generation
+        return None
+    return row[0] if row else None
+
+def _cache_put(key: str, value: str) -> None:
+    """
+    Store an LLM response in DB_PATH. Failures are ignored (cache is best-effort).
+    """
+    if not value or not os.path.exists(DB_PATH):
+        return
+    try:
+        with _CONN_LOCK:
+            _get_conn().execute(f"INSERT OR REPLACE INTO {LLM_CACHE_TABLE} (key, value) VALUES (?, ?)", (key, value))
+    except sqlite3.Error:
+        pass
+
 # ---- Safety check ----
-def is_sql_safe(sql: str) -> bool:
+# One pass over the query: DDL/DML keywords, SQL comments, or a semicolon followed by
+# anything (i.e. a second statement). A single trailing semicolon is allowed.
+_FORBIDDEN_RE = re.compile(
+    r"\b(?:insert|update|delete|drop|alter|create|attach|pragma|vacuum)\b|--|;\s*\S",
+    re.IGNORECASE,
+)
+
+@dataclass(frozen=True)
+class CleanedSQL:
     """
-    Allow only SELECT queries. Block any DDL/DML or dangerous characters.
+    SQL text (stripped) with its lowercased form and safety verdict, computed once.
+    run_sql and is_sql_safe accept it directly and skip re-checking.
+    """
+    raw: str
+    lower: str
+    safe: bool
+
+def _is_lower_sql_safe(sql_lower: str) -> bool:
+    """
+    Safety rules applied to already stripped + lowercased SQL.
     """
-    if not sql:
-        return False
-    sql_lower = sql.strip().lower()
     # Disallow statements other than select
     if not sql_lower.startswith("select"):
         return False
-    # Block common dangerous keywords or multiple statements
-    forbidden = ["insert", "update", "delete", "drop", "alter", "create", "attach", "pragma", "vacuum", ";--", "--"]
-    if any(token in sql_lower for token in forbidden):
-        return False
-    # Prevent multiple statements separated by semicolon
-    if ";" in sql_lower and sql_lower.count(";") > 1:
+    # Block dangerous keywords, comments, or multiple statements
+    return _FORBIDDEN_RE.search(sql_lower) is None
+
+def _make_cleaned_sql(sql: str, sql_lower: str) -> CleanedSQL:
+    """
+    Build a CleanedSQL from already stripped `sql` and its exact lowercase `sql_lower`.
+    Internal only: the verdict is computed from `sql_lower`, so it must equal sql.lower().
+    """
+    return CleanedSQL(raw=sql, lower=sql_lower, safe=_is_lower_sql_safe(sql_lower))
+
+def check_sql(sql: str) -> CleanedSQL:
+    """
+    Strip the SQL, lowercase it once and run the safety check.
+    """
+    sql = (sql or "").strip()
+    return _make_cleaned_sql(sql, sql.lower())
+
+def is_sql_safe(sql) -> bool:
+    """
+    Allow only SELECT queries. Block any DDL/DML or dangerous characters.
+    Accepts a plain string or a CleanedSQL (whose verdict is reused).
+    """
+    if isinstance(sql, CleanedSQL):
+        return sql.safe
+    if not sql:
         return False
-    # If semicolon exists, ensure it is at end only (still be cautious)
-    return True
+    return check_sql(sql).safe
 
 # ---- LLM -> SQL generation ----
-def generate_sql_from_text(question: str, model="gpt-4o-mini", max_tokens: int = 300) -> str:
+# Stop sequences end decoding server-side as soon as the answer is complete.
+# SQL stops at the end of the (single) statement; "\n\n" is not used there because
+# a blank line inside a multi-line query would truncate it.
+SQL_STOP = [";"]
+# Small default budget (the stop sequence ends most queries well before it); a reply that
+# still hits it is retried once with the larger budget before giving up
+SQL_MAX_TOKENS = 128
+SQL_RETRY_MAX_TOKENS = 300
+SQL_TRUNCATED_MSG = "The generated SQL was too long and got cut off. Try a simpler or more specific question."
+# The explanation is one short paragraph
+EXPLAIN_STOP = ["\n\n"]
+
+def _build_sql_user_msg(question: str, output_rule: str) -> str:
     """
-    Generate a SQLite SELECT SQL query from a natural language question.
-    This function provides a strong system prompt with the exact schema and rules.
+    Build the schema-aware user prompt. `output_rule` is the first rule line and describes the output format.
     """
-    # Build a careful prompt with explicit rules
-    system_msg = (
-        "You are an expert SQL generator for SQLite databases. "
-        "You must follow instructions strictly and only output a single valid SQL SELECT statement (no explanation). "
-        "Do NOT return any commentary. Do NOT use backticks. Use the exact table and column names provided."
-    )
-
-    user_msg = f"""
+    return f"""
 {SCHEMA_NOTE}
 
 Important rules for generation:
-- Output ONLY one SELECT SQL statement. Do NOT output explanation or text.
+{output_rule}
 - Use the exact column names from the schema above:
   - product_name is products.product_name (NOT products.name)
   - product primary key is products.product_id
@@ -145,64 +290,343 @@ User question:
 \"\"\"{question}\"\"\"
 """
 
-    try:
-        resp = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": system_msg},
-                {"role": "user", "content": user_msg},
-            ],
-            max_tokens=max_tokens,
-            temperature=0.0,
-        )
-        raw = resp.choices[0].message.content
-    except Exception as e:
-        # Bubble up exception to caller (app.py will handle and display)
-        raise Exception(f"OpenAI API error: {e}")
+def _sql_messages(question: str) -> list:
+    """
+    Chat messages (system + user) for SQL-only generation.
+    """
+    # Build a careful prompt with explicit rules
+    system_msg = (
+        "You are an expert SQL generator for SQLite databases. "
+        "You must follow instructions strictly and only output a single valid SQL SELECT statement (no explanation). "
+        "Do NOT return any commentary. Do NOT use backticks. Use the exact table and column names provided."
+    )
+
+    user_msg = _build_sql_user_msg(
+        question,
+        "- Output ONLY one SELECT SQL statement. Do NOT output explanation or text.",
+    )
+    return [
+        {"role": "system", "content": system_msg},
+        {"role": "user", "content": user_msg},
+    ]
 
-    sql = _clean_model_sql(raw)
+def clean_generated_sql(raw: str) -> CleanedSQL:
+    """
+    Turn raw model output into the final SQL (strip fences/commentary, add missing joins).
+    Use this on the last text yielded by generate_sql_from_text(..., stream=True).
+    """
+    sql = (_clean_model_sql(raw) or "").strip()
+    sql_lower = sql.lower()
     # Try to auto-fix missing joins if model forgot to add them
-    sql = _auto_fix_joins(sql)
+    fixed_sql = _auto_fix_joins(sql, sql_lower)
+    if fixed_sql is not sql:
+        # Joins were injected, so the text changed: lowercase + check it afresh
+        return check_sql(fixed_sql)
+    # Unchanged: reuse the lowercased text computed above
+    return _make_cleaned_sql(sql, sql_lower)
+
+def _sql_token_budgets(max_tokens: int) -> tuple:
+    """
+    max_tokens for the first attempt and, if it is cut off, the retry.
+    """
+    if max_tokens >= SQL_RETRY_MAX_TOKENS:
+        return (max_tokens,)
+    return (max_tokens, SQL_RETRY_MAX_TOKENS)
+
+def generate_sql_from_text(question: str, model="gpt-4o-mini", max_tokens: int = SQL_MAX_TOKENS, stream: bool = False):
+    """
+    Generate a SQLite SELECT SQL query from a natural language question.
+    This function provides a strong system prompt with the exact schema and rules.
+    Identical questions (ignoring whitespace) are served from the LLM cache.
+    A reply cut off at max_tokens is retried once with SQL_RETRY_MAX_TOKENS.
+    With stream=True, returns a generator of the raw text generated so far (it starts
+    over if the reply is retried) instead of the final CleanedSQL; pass the last
+    text to clean_generated_sql.
+    """
+    if stream:
+        return _stream_sql(_normalize_prompt(question), model, max_tokens)
+    return _generate_sql_cached(_normalize_prompt(question), model, max_tokens)
+
+@functools.lru_cache(maxsize=512)
+def _generate_sql_cached(question: str, model: str, max_tokens: int) -> CleanedSQL:
+    """
+    Cached body of generate_sql_from_text. `question` must already be normalized.
+    Errors are raised (not cached) so a failed call is retried next time.
+    """
+    messages = _sql_messages(question)
+    key = _cache_key("sql", model, messages)
+    cached = _cache_get(key)
+    if cached is not None:
+        return check_sql(cached)
+
+    for budget in _sql_token_budgets(max_tokens):
+        try:
+            resp = _client().chat.completions.create(
+                model=model,
+                messages=messages,
+                max_tokens=budget,
+                temperature=0.0,
+                stop=SQL_STOP,
+            )
+            raw = resp.choices[0].message.content
+            finish_reason = resp.choices[0].finish_reason
+        except Exception as e:
+            # Bubble up exception to caller (app.py will handle and display)
+            raise Exception(f"OpenAI API error: {e}")
+        if finish_reason != "length":
+            break
+    else:
+        # Cut off mid-query even with the larger budget: never return (or cache) a truncated statement
+        raise Exception(SQL_TRUNCATED_MSG)
+
+    sql = clean_generated_sql(raw)
+    _cache_put(key, sql.raw)
     return sql
 
+def _stream_sql(question: str, model: str, max_tokens: int):
+    """
+    Streaming body of generate_sql_from_text: yields the raw text so far as chunks arrive.
+    A cache hit is yielded once. If the model hits the token budget, the stream is retried
+    once with the larger budget and the yielded text starts over. The cleaned SQL is cached
+    once a stream completes; if the retry is cut off too, nothing is cached and an exception
+    is raised after its last chunk.
+    """
+    messages = _sql_messages(question)
+    key = _cache_key("sql", model, messages)
+    cached = _cache_get(key)
+    if cached is not None:
+        yield cached
+        return
+
+    for budget in _sql_token_budgets(max_tokens):
+        parts = []
+        finish_reason = None
+        try:
+            stream = _client().chat.completions.create(
+                model=model,
+                messages=messages,
+                max_tokens=budget,
+                temperature=0.0,
+                stop=SQL_STOP,
+                stream=True,
+            )
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                text = chunk.choices[0].delta.content or ""
+                finish_reason = chunk.choices[0].finish_reason or finish_reason
+                if text:
+                    parts.append(text)
+                    yield "".join(parts)
+        except Exception as e:
+            raise Exception(f"OpenAI API error: {e}")
+
+        if finish_reason != "length":
+            _cache_put(key, clean_generated_sql("".join(parts)).raw)
+            return
+
+    # Cut off mid-query even with the larger budget: don't cache it, and tell the caller it is not a usable result
+    raise Exception(SQL_TRUNCATED_MSG)
+
 # ---- LLM-based explanation ----
 def explain_sql(sql: str, model="gpt-4o-mini", max_tokens: int = 200) -> str:
     """
     Ask the model to explain the SQL in simple English.
+    Explanations are cached per (model, SQL). Accepts a plain string or a CleanedSQL.
+    """
+    if isinstance(sql, CleanedSQL):
+        sql = sql.raw
+    try:
+        return _explain_sql_cached(_normalize_prompt(sql), model, max_tokens)
+    except Exception as e:
+        return f"(Explanation failed: {e})"
+
+@functools.lru_cache(maxsize=512)
+def _explain_sql_cached(sql: str, model: str, max_tokens: int) -> str:
+    """
+    Cached body of explain_sql. Errors are raised (not cached) so explain_sql can report them.
+    """
+    messages = _explain_messages(sql)
+    key = _cache_key("explain", model, messages)
+    cached = _cache_get(key)
+    if cached is not None:
+        return cached
+
+    expl = _request_explanation(messages, model, max_tokens)
+    _cache_put(key, expl)
+    return expl
+
+def _explain_messages(sql: str) -> list:
+    """
+    Chat messages for explaining `sql` (already normalized).
     """
     prompt = f"Explain this SQL query in simple plain English in 2-3 sentences. SQL:\n\n{sql}"
+    return [{"role": "user", "content": prompt}]
+
+def _request_explanation(messages: list, model: str, max_tokens: int) -> str:
+    """
+    One explanation call to the model (no caching).
+    """
+    resp = _client().chat.completions.create(
+        model=model,
+        messages=messages,
+        max_tokens=max_tokens,
+        temperature=0.0,
+        stop=EXPLAIN_STOP,
+    )
+    return resp.choices[0].message.content.strip()
+
+# Background workers for LLM calls that can overlap with query execution / rendering
+_LLM_EXECUTOR = concurrent.futures.ThreadPoolExecutor(max_workers=4, thread_name_prefix="llm")
+
+class _ExplanationFuture(concurrent.futures.Future):
+    """
+    Future returned by explain_sql_async. cancel() also discards an explanation that is
+    already being generated, so it is never written to the persistent cache.
+    """
+    def __init__(self):
+        super().__init__()
+        self.discarded = threading.Event()
+
+    def cancel(self) -> bool:
+        self.discarded.set()
+        return super().cancel()
+
+def explain_sql_async(sql: str, model="gpt-4o-mini", max_tokens: int = 200) -> concurrent.futures.Future:
+    """
+    Start explain_sql in a background thread and return a Future for its result.
+    Lets the caller run the query and render results while the explanation is generated.
+    Cancel the Future (e.g. when the query fails) to drop the explanation: it is not
+    requested if it hasn't started yet, and not cached if it has.
+    """
+    if isinstance(sql, CleanedSQL):
+        sql = sql.raw
+    future = _ExplanationFuture()
+    _LLM_EXECUTOR.submit(_explain_sql_worker, future, _normalize_prompt(sql), model, max_tokens)
+    return future
+
+def _explain_sql_worker(future: _ExplanationFuture, sql: str, model: str, max_tokens: int):
+    """
+    Background body of explain_sql_async. Same result as explain_sql, but the persistent
+    cache is only written if the Future was not cancelled meanwhile.
+    """
+    if not future.set_running_or_notify_cancel():
+        # Cancelled before it started: skip the model call
+        return
+    try:
+        messages = _explain_messages(sql)
+        key = _cache_key("explain", model, messages)
+        expl = _cache_get(key)
+        if expl is None:
+            expl = _request_explanation(messages, model, max_tokens)
+            if not future.discarded.is_set():
+                _cache_put(key, expl)
+    except Exception as e:
+        expl = f"(Explanation failed: {e})"
+    future.set_result(expl)
+
+# ---- LLM -> SQL + explanation in one call ----
+def generate_sql_and_explanation(question: str, model="gpt-4o-mini", max_tokens: int = 500) -> tuple:
+    """
+    Generate the SQL and its plain-English explanation with a single chat completion.
+    Returns (CleanedSQL, explanation). If the model reply is not the expected JSON,
+    falls back to generate_sql_from_text + explain_sql (two calls).
+    JSON mode can't be streamed as readable SQL, so this is for non-streaming callers.
+    """
+    return _generate_sql_and_explanation_cached(_normalize_prompt(question), model, max_tokens)
+
+@functools.lru_cache(maxsize=512)
+def _generate_sql_and_explanation_cached(question: str, model: str, max_tokens: int) -> tuple:
+    """
+    Cached body of generate_sql_and_explanation. The persistent cache stores the JSON reply.
+    Errors (including in the fallback path) are raised, so they are never cached.
+    """
+    system_msg = (
+        "You are an expert SQL generator for SQLite databases. "
+        "You must follow instructions strictly. Use the exact table and column names provided. "
+        "Return strict JSON with keys sql and explanation, no prose. "
+        "sql is a single valid SQL SELECT statement without backticks; "
+        "explanation explains that query in simple plain English in 2-3 sentences."
+    )
+    user_msg = _build_sql_user_msg(
+        question,
+        '- Output ONLY a JSON object: {"sql": "<one SELECT statement>", "explanation": "<2-3 sentences>"}.',
+    )
+    messages = [
+        {"role": "system", "content": system_msg},
+        {"role": "user", "content": user_msg},
+    ]
+
+    key = _cache_key("sql+explain", model, messages)
+    cached = _cache_get(key)
+    if cached is not None:
+        data = json.loads(cached)
+        return check_sql(data["sql"]), data["explanation"]
+
     try:
-        resp = client.chat.completions.create(
+        resp = _client().chat.completions.create(
             model=model,
-            messages=[{"role": "user", "content": prompt}],
+            messages=messages,
             max_tokens=max_tokens,
             temperature=0.0,
+            response_format={"type": "json_object"},
         )
-        expl = resp.choices[0].message.content.strip()
-        return expl
+        raw = resp.choices[0].message.content
     except Exception as e:
-        return f"(Explanation failed: {e})"
+        raise Exception(f"OpenAI API error: {e}")
+
+    try:
+        # A reply cut off at max_tokens is invalid JSON and takes the fallback below
+        data = json.loads(raw)
+        sql = clean_generated_sql(data["sql"])
+        explanation = data["explanation"].strip()
+    except (TypeError, ValueError, KeyError, AttributeError):
+        sql, explanation = None, ""
+
+    if sql is None or not sql.raw or not explanation:
+        # Model did not return the expected JSON; use the existing two-call path.
+        # Call the cached explain body directly (not explain_sql) so a failure raises
+        # instead of being memoized here as "(Explanation failed: ...)" text.
+        sql = generate_sql_from_text(question, model)
+        return sql, _explain_sql_cached(_normalize_prompt(sql.raw), model, 200)
+
+    _cache_put(key, json.dumps({"sql": sql.raw, "explanation": explanation}))
+    return sql, explanation
 
 # ---- Execute SQL on SQLite ----
-def run_sql(sql: str) -> pd.DataFrame:
+def run_sql(sql) -> pd.DataFrame:
     """
     Run the SQL on local SQLite DB (DB_PATH) and return a pandas DataFrame.
+    Accepts a plain string or a CleanedSQL (already checked, so not re-checked here).
     """
-    if not is_sql_safe(sql):
+    if not isinstance(sql, CleanedSQL):
+        sql = check_sql(sql)
+    if not sql.safe:
         raise Exception("SQL blocked by safety policy (only SELECT allowed or query contained unsafe tokens).")
 
-    # Clean trailing semicolons if present (pandas.read_sql_query can accept them but keep consistent)
-    sql_to_run = sql.strip().rstrip(";")
+    # Clean trailing semicolons if present (keep a single statement for both drivers)
+    sql_to_run = sql.raw.rstrip(";")
+
+    if adbc_sqlite is not None:
+        try:
+            with _CONN_LOCK:
+                with _get_adbc_conn().cursor() as cur:
+                    cur.execute(sql_to_run)
+                    table = cur.fetch_arrow_table()
+            # Default numpy dtypes (text -> object) so the auto chart's select_dtypes keeps working
+            return table.to_pandas()
+        except Exception as e:
+            raise Exception(f"SQL execution error: {e}")
 
-    conn = sqlite3.connect(DB_PATH)
     try:
-        df = pd.read_sql_query(sql_to_run, conn)
+        with _CONN_LOCK:
+            cur = _get_conn().execute(sql_to_run)
+            columns = [d[0] for d in cur.description]
+            rows = cur.fetchall()
     except Exception as e:
         # Provide helpful error with original SQL
-        conn.close()
         raise Exception(f"SQL execution error: {e}")
-    conn.close()
-    return df
+    return pd.DataFrame.from_records(rows, columns=columns)
 
 # ---- Optional: utility to get DB schema at runtime ----
 def get_db_schema() -> dict:
@@ -213,15 +637,19 @@ def get_db_schema() -> dict:
     schema = {}
     if not os.path.exists(DB_PATH):
         return schema
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    try:
-        cur.execute("SELECT name FROM sqlite_master WHERE type='table';")
-        tables = [row[0] for row in cur.fetchall()]
-        for t in tables:
-            cur.execute(f"PRAGMA table_info({t});")
-            cols = [r[1] for r in cur.fetchall()]
-            schema[t] = cols
-    finally:
-        conn.close()
+    with _CONN_LOCK:
+        cur = _get_conn().cursor()
+        try:
+            # Skip SQLite internals (sqlite_sequence, sqlite_stat1) and the LLM cache table
+            cur.execute(
+                "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%' AND name != ?;",
+                (LLM_CACHE_TABLE,),
+            )
+            tables = [row[0] for row in cur.fetchall()]
+            for t in tables:
+                cur.execute(f"PRAGMA table_info({t});")
+                cols = [r[1] for r in cur.fetchall()]
+                schema[t] = cols
+        finally:
+            cur.close()
     return schema
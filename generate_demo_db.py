@@ -2,20 +2,27 @@ import sqlite3
 import random
 import datetime
 
-# Helper: random date generator
+import numpy as np
 
-def random_date(start_year=2023, end_year=2025):
+rng = np.random.default_rng()
+
+# Helper: random date generator (vectorized, returns n "YYYY-MM-DD" strings)
+
+def random_dates(n, start_year=2023, end_year=2025):
     start = datetime.date(start_year, 1, 1)
     end = datetime.date(end_year, 12, 31)
 
     delta = end - start
-    random_days = random.randint(0, delta.days)
+    random_days = rng.integers(0, delta.days + 1, n)
 
-    return (start + datetime.timedelta(days=random_days)).isoformat()
+    return (np.datetime64(start, "D") + random_days).astype(str).tolist()
 
 # Connect
 
 conn = sqlite3.connect("sales.db")
+# WAL + no per-write fsync: the demo DB is rebuilt from scratch anyway
+conn.execute("PRAGMA journal_mode=WAL")
+conn.execute("PRAGMA synchronous=OFF")
 cur = conn.cursor()
 
 # Drop and recreate tables
@@ -48,6 +55,10 @@ CREATE TABLE sales (
 """)
 
 
+# Insert all rows in one transaction (single commit instead of one per statement)
+
+conn.execute("BEGIN")
+
 # Product Data (10 products)
 products = [
     (1, "Laptop Pro 14", "Electronics"),
@@ -82,37 +93,54 @@ for cid in range(1, 16):
 
 cur.executemany("INSERT INTO customers VALUES (?, ?, ?)", customers)
 
-# Generate 120+ sales records
-
-sales = []
-
-for sid in range(1, 151):   # 150 rows
-    date = random_date()
-    product_id = random.randint(1, 10)
-    customer_id = random.randint(1, 15)
-    quantity = random.randint(1, 10)
+# Generate sales records (vectorized so larger N stays fast)
+
+n = 150   # 150 rows
+
+# realistic prices per product
+price_map = {
+    1: 90000,  # Laptop Pro
+    2: 70000,  # Laptop Air
+    3: 1200,   # Mouse
+    4: 3500,   # Keyboard
+    5: 65000,  # Smartphone X
+    6: 35000,  # Smartphone Lite
+    7: 18000,  # Washing Machine
+    8: 24000,  # Refrigerator
+    9: 34000,  # LED TV
+    10: 42000  # Air Conditioner
+}
+# Index i holds the price of product_id i (slot 0 unused)
+base_prices = np.array([0] + [price_map[pid] for pid in range(1, 11)])
+
+product_ids = rng.integers(1, 11, n)
+customer_ids = rng.integers(1, 16, n)
+quantities = rng.integers(1, 11, n)
+prices = base_prices[product_ids] + rng.integers(-2000, 2001, n)
+dates = random_dates(n)
+
+sales = list(zip(
+    range(1, n + 1),
+    dates,
+    product_ids.tolist(),
+    customer_ids.tolist(),
+    quantities.tolist(),
+    prices.tolist(),
+))
 
-    # realistic prices per product
-    price_map = {
-        1: 90000,  # Laptop Pro
-        2: 70000,  # Laptop Air
-        3: 1200,   # Mouse
-        4: 3500,   # Keyboard
-        5: 65000,  # Smartphone X
-        6: 35000,  # Smartphone Lite
-        7: 18000,  # Washing Machine
-        8: 24000,  # Refrigerator
-        9: 34000,  # LED TV
-        10: 42000  # Air Conditioner
-    }
+cur.executemany("INSERT INTO sales VALUES (?, ?, ?, ?, ?, ?)", sales)
 
-    price = price_map[product_id] + random.randint(-2000, 2000)
+conn.commit()
 
-    sales.append((sid, date, product_id, customer_id, quantity, price))
+# Indexes on join/filter columns so sales -> products/customers joins use lookups, not scans
 
-cur.executemany("INSERT INTO sales VALUES (?, ?, ?, ?, ?, ?)", sales)
+cur.executescript("""
+CREATE INDEX idx_sales_product ON sales(product_id);
+CREATE INDEX idx_sales_customer ON sales(customer_id);
+CREATE INDEX idx_sales_date ON sales(date);
+ANALYZE;
+""")
 
-conn.commit()
 conn.close()
 
 print("✅ sales.db generated successfully with 150 realistic sales records!")